@@ -22,25 +22,45 @@ class Settings(BaseSettings):
     OUTPUT_DIR: Path = Path("./outputs")
     TEMP_DIR: Path = Path("./temp")
     MAX_VIDEO_AGE_HOURS: int = 24
+    MAX_CONCURRENT_JOBS: int = 4   # Worker threads for synchronous job functions
     
     # Groq Settings
     GROQ_MODEL: str = "llama-3.3-70b-versatile"
     GROQ_MAX_TOKENS: int = 2048
     GROQ_TEMPERATURE: float = 0.7
+    GROQ_WARMUP: bool = True       # Ping Groq on startup to avoid cold-start latency
+    LOCAL_LLM_MODEL_PATH: str = "" # Optional llama.cpp GGUF used when Groq is unavailable
+    GROQ_CACHE_TTL_SECONDS: int = 86400 * 30  # On-disk scene cache (needs diskcache); 0 disables
     
     # OpenAI Sora Settings
     # Default to a strong general-purpose Sora model.
     SORA_MODEL: str = "sora-2-pro-2025-10-06"
+    OPENAI_WEBHOOK_SECRET: str = ""  # Enables /webhooks/openai instead of status polling
+    SORA_MAX_CONCURRENT_STATUS_CALLS: int = 10
+    SORA_CONCURRENCY: int = 4      # Max Sora jobs rendering at once (match account limit)
     
     # Video Generation Settings
     DEFAULT_VIDEO_WIDTH: int = 1280
     DEFAULT_VIDEO_HEIGHT: int = 720
     MAX_SCENE_DURATION: int = 10   # Max seconds per Sora clip
-    
+
+    # FFmpeg (composition)
+    FFMPEG_BINARY: str = "ffmpeg"
+    FFPROBE_BINARY: str = "ffprobe"
+    X264_PRESET: str = "veryfast"  # Software (libx264) encode speed/size trade-off
+    X264_CRF: int = 23
+    COMPOSE_TIMEOUT_S: int = 900   # Kill a stalled final encode after this long
+
     # WebSocket settings
     WEBSOCKET_ENABLED: bool = True
     WEBSOCKET_PING_INTERVAL: int = 20
     WEBSOCKET_PING_TIMEOUT: int = 20
+
+    # Redis job store (optional; shares jobs/progress across workers)
+    REDIS_ENABLED: bool = False
+    REDIS_HOST: str = "localhost"
+    REDIS_PORT: int = 6379
+    REDIS_DB: int = 0
     
     class Config:
         env_file = ".env"
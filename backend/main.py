@@ -2,12 +2,14 @@
 Strang Backend API - Groq (Script) + OpenAI Sora (Video) + EdgeTTS (Audio)
 Clean, efficient pipeline rebuilt for Cinematic AI Video Generation
 """
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import asyncio
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 from typing import Optional, List
 from datetime import datetime
@@ -36,13 +38,20 @@ log_dir = Path(settings.TEMP_DIR) / "logs"
 log_dir.mkdir(parents=True, exist_ok=True)
 log_file = log_dir / f"strang_{datetime.now().strftime('%Y%m%d')}.log"
 
+# Records are formatted on the calling thread and written to file/stdout by a
+# background listener, so logging never blocks the event loop on I/O
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(
+    log_queue,
+    logging.FileHandler(log_file),
+    logging.StreamHandler()
+)
+log_listener.start()
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 
 logger = logging.getLogger(__name__)
@@ -98,6 +107,27 @@ def get_composer_service() -> VideoComposer:
     return _composer_service
 
 
+async def gather_or_cancel(*aws) -> list:
+    """
+    Run awaitables concurrently and return their results in order.
+    On the first failure the rest are cancelled and that exception is re-raised.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # Also runs if we are cancelled ourselves; cancel() is a no-op on finished tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
 async def process_video_generation(job_id: str, request: ProcessVideoRequest) -> dict:
     """
     Main video generation pipeline:
@@ -105,7 +135,7 @@ async def process_video_generation(job_id: str, request: ProcessVideoRequest) ->
     2. Parallel Generation:
        - EdgeTTS generates Audio for each scene
        - Sora generates Video for each scene
-    3. MoviePy stitches them together
+    3. FFmpeg stitches them together
     """
     
     try:
@@ -124,7 +154,7 @@ async def process_video_generation(job_id: str, request: ProcessVideoRequest) ->
         if not scenes:
             raise RuntimeError("Failed to generate valid scenes from text")
             
-        print(f"[{job_id}] Generated {len(scenes)} scenes")
+        logger.info("[%s] Generated %d scenes", job_id, len(scenes))
         job_manager.update_progress(job_id, JobStatus.PROCESSING, 20, "processing", f"Generated {len(scenes)} scenes. Starting production...")
         
         # ============================================
@@ -133,52 +163,58 @@ async def process_video_generation(job_id: str, request: ProcessVideoRequest) ->
         openai = get_openai_service()
         tts = get_tts_service()
         
-        generated_scenes = []
-        total_scenes = len(scenes)
-        
-        # Process scenes sequentially or in parallel?
-        # Parallel is faster but might hit rate limits. Let's do semi-parallel or sequential for safety first.
-        # We'll do sequential scenes, but parallel Audio/Video within a scene.
+        # Only scenes with both parts are produced; progress counts these
+        dispatched = [
+            (i + 1, scene["narration"], scene["video_prompt"])
+            for i, scene in enumerate(scenes)
+            if scene.get("narration") and scene.get("video_prompt")
+        ]
+        total_scenes = len(dispatched)
+        voice = request.voice_id or "en-US-GuyNeural"
+        finished = 0
         
-        for i, scene in enumerate(scenes):
-            scene_num = i + 1
-            narration = scene.get("narration", "")
-            video_prompt = scene.get("video_prompt", "")
-            
-            job_manager.update_progress(
-                job_id, 
-                JobStatus.PROCESSING, 
-                20 + int((i / total_scenes) * 60), 
-                "production", 
-                f"Producing Scene {scene_num}/{total_scenes}..."
-            )
-            
-            # Generate Audio & Video validation
-            if not narration or not video_prompt:
-                continue
-                
-            # Create tasks
+        async def produce_scene(scene_num: int, narration: str, video_prompt: str) -> dict:
+            """Generate audio and video for one scene in parallel"""
+            nonlocal finished
             audio_task = tts.generate_audio(
                 text=narration,
-                voice=request.voice_id or "en-US-GuyNeural",
+                voice=voice,
                 file_name=f"{job_id}_scene_{scene_num}.mp3"
             )
-            
             video_task = openai.generate_scene_video(
                 scene_prompt=video_prompt
             )
             
-            # Run parallel
-            print(f"[{job_id}] Starting Scene {scene_num} generation...")
-            audio_path, video_url = await asyncio.gather(audio_task, video_task)
+            logger.debug("[%s] Starting Scene %d generation...", job_id, scene_num)
+            # If either half fails the other is cancelled
+            audio_path, video_path = await gather_or_cancel(audio_task, video_task)
+            logger.debug("[%s] Finished Scene %d", job_id, scene_num)
             
-            generated_scenes.append({
+            finished += 1
+            job_manager.update_progress(
+                job_id, 
+                JobStatus.PROCESSING, 
+                20 + int((finished / total_scenes) * 60), 
+                "production", 
+                f"Produced {finished}/{total_scenes} scenes..."
+            )
+            return {
                 "audio_path": audio_path,
-                "video_path": video_url, # Composer needs to handle URL downloading or we do it here
+                "video_path": video_path,
                 "narration": narration
-            })
-            
-            print(f"[{job_id}] Finished Scene {scene_num}")
+            }
+        
+        # All scenes run concurrently; OpenAIService bounds in-flight Sora jobs
+        # (SORA_CONCURRENCY) so a large storyboard queues instead of tripping 429s.
+        # A failed scene cancels the rest so they stop rendering (and reporting).
+        job_manager.update_progress(
+            job_id, 
+            JobStatus.PROCESSING, 
+            20, 
+            "production", 
+            f"Producing {total_scenes} scenes..."
+        )
+        generated_scenes = await gather_or_cancel(*(produce_scene(*scene) for scene in dispatched))
             
         if not generated_scenes:
             raise RuntimeError("Production failed: No scenes were successfully generated")
@@ -190,39 +226,8 @@ async def process_video_generation(job_id: str, request: ProcessVideoRequest) ->
         
         composer = get_composer_service()
         
-        # We need to make sure video_path is local for MoviePy usually
-        # The VideoComposer might need update to handle URLs, or we download here.
-        # Check VideoComposer... it takes video_path.
-        # Let's download video URLs here to temp dir.
-        
-        import httpx
-        async with httpx.AsyncClient() as client:
-            for i, scene in enumerate(generated_scenes):
-                url = scene["video_path"]
-                if url.startswith("http"):
-                    local_filename = f"{job_id}_scene_{i+1}.mp4"
-                    local_path = settings.TEMP_DIR / local_filename
-                    
-                    job_manager.update_progress(
-                        job_id, 
-                        JobStatus.RENDERING, 
-                        80 + int((i / len(generated_scenes)) * 10), 
-                        "rendering", 
-                        f"Downloading clip {i+1}..."
-                    )
-                    
-                    print(f"[{job_id}] Downloading {url} to {local_path}...")
-                    resp = await client.get(url, timeout=60.0)
-                    if resp.status_code == 200:
-                        with open(local_path, "wb") as f:
-                            f.write(resp.content)
-                        scene["video_path"] = str(local_path)
-                    else:
-                        raise RuntimeError(f"Failed to download video clip for scene {i+1}")
-
-        # Stitch
-        final_video_url = await asyncio.to_thread(
-            composer.compose_video,
+        # Stitch (OpenAIService already saved each clip locally)
+        final_video_url, thumbnail_url = await composer.compose_video(
             scenes=generated_scenes,
             job_id=job_id
         )
@@ -234,7 +239,7 @@ async def process_video_generation(job_id: str, request: ProcessVideoRequest) ->
         
         return {
             "video_url": final_video_url,
-            "thumbnail_url": None, # Could extract later
+            "thumbnail_url": thumbnail_url,
             "duration": None, # Could calculate
             "script": final_script
         }
@@ -245,6 +250,23 @@ async def process_video_generation(job_id: str, request: ProcessVideoRequest) ->
         raise
 
 
+@app.on_event("startup")
+async def startup_event():
+    # Build API clients up front so their connection warmup happens before
+    # the first user request instead of during it
+    if settings.GROQ_API_KEY:
+        get_groq_service()
+    if settings.OPENAI_API_KEY:
+        app.state.openai_warmup = asyncio.create_task(get_openai_service().warmup())
+    await job_manager.connect_store()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_manager.close_store()
+    log_listener.stop()
+
+
 @app.get("/")
 async def root():
     return {
@@ -260,7 +282,7 @@ async def process_video(request: ProcessVideoRequest):
     if not settings.OPENAI_API_KEY:
         raise HTTPException(status_code=500, detail="OPENAI_API_KEY missing")
         
-    job_id = job_manager.create_job()
+    job_id = await job_manager.create_job()
     job_manager.start_job_async(job_id, process_video_generation, request)
     
     return ProcessVideoResponse(
@@ -272,21 +294,39 @@ async def process_video(request: ProcessVideoRequest):
 
 @app.get("/job/{job_id}/progress", response_model=JobProgress)
 async def get_job_progress(job_id: str):
-    progress = job_manager.get_job_progress(job_id)
+    progress = await job_manager.get_job_progress(job_id)
     if not progress:
         raise HTTPException(status_code=404, detail="Job not found")
     return progress
 
 @app.get("/job/{job_id}/result", response_model=VideoResult)
 async def get_job_result(job_id: str):
-    result = job_manager.get_job_result(job_id)
+    result = await job_manager.get_job_result(job_id)
     if not result:
-        progress = job_manager.get_job_progress(job_id)
+        progress = await job_manager.get_job_progress(job_id)
         if progress and progress.status != JobStatus.COMPLETED:
             raise HTTPException(status_code=202, detail="Job processing")
         raise HTTPException(status_code=404, detail="Job not found")
     return result
 
+@app.post("/webhooks/openai")
+async def openai_webhook(request: Request):
+    """Receive Sora job notifications so waiting jobs wake up immediately"""
+    if not settings.OPENAI_WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Webhooks not configured")
+    
+    openai = get_openai_service()
+    body = await request.body()
+    try:
+        event = openai.client.webhooks.unwrap(body, request.headers, secret=settings.OPENAI_WEBHOOK_SECRET)
+    except Exception as e:
+        logger.warning("Rejected OpenAI webhook: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid webhook signature")
+    
+    if event.type.startswith("video."):
+        openai.notify_video_event(event.data.id)
+    return {"received": True}
+
 @app.get("/api/voices", response_model=AvailableVoicesResponse)
 async def list_voices():
     tts = get_tts_service()
@@ -304,7 +344,7 @@ async def list_voices():
 
 @app.websocket("/ws/job/{job_id}")
 async def websocket_endpoint(websocket: WebSocket, job_id: str):
-    progress = job_manager.get_job_progress(job_id)
+    progress = await job_manager.get_job_progress(job_id)
     if not progress:
         await websocket.close(code=1008, reason="Job not found")
         return
@@ -5,11 +5,11 @@ Groq provides free access to powerful LLMs with extremely fast inference.
 Perfect for generating professional cinematic scripts for OpenAI Sora.
 """
 from groq import Groq
-from typing import Optional, List, Dict
-import time
+from typing import List, Dict
+import threading
+import hashlib
 import logging
-import re
-import json
+import orjson
 from config import settings
 
 # Set up logging
@@ -23,6 +23,46 @@ except ImportError:
     RateLimitError = Exception
     APIError = Exception
 
+# Optional on-disk cache for generated scenes (shared across restarts and workers)
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+_DCACHE = None
+if diskcache is not None and settings.GROQ_CACHE_TTL_SECONDS > 0:
+    _DCACHE = diskcache.Cache(str(settings.TEMP_DIR / "groq_cache"), size_limit=2**30)
+
+# Optional local llama.cpp model, loaded once per process (weights are mmapped)
+_local_llm = None
+_local_llm_missing = False
+_local_llm_lock = threading.Lock()
+# Llama instances aren't thread-safe; calls come from to_thread workers
+_local_llm_infer_lock = threading.Lock()
+
+
+def _get_local_llm():
+    """Lazily load the local llama.cpp model, or return None if not configured/installed"""
+    global _local_llm, _local_llm_missing
+    if not settings.LOCAL_LLM_MODEL_PATH or _local_llm_missing:
+        return None
+    with _local_llm_lock:
+        if _local_llm is None and not _local_llm_missing:
+            try:
+                from llama_cpp import Llama
+            except ImportError as e:
+                _local_llm_missing = True
+                logger.warning("LOCAL_LLM_MODEL_PATH is set but llama_cpp is not installed: %s", e)
+                return None
+            _local_llm = Llama(
+                model_path=settings.LOCAL_LLM_MODEL_PATH,
+                n_gpu_layers=-1,
+                n_ctx=4096,
+                verbose=False
+            )
+            logger.info("Loaded local model: %s", settings.LOCAL_LLM_MODEL_PATH)
+    return _local_llm
+
 
 class GroqService:
     """Service for generating AI video scripts using Groq's free API"""
@@ -54,6 +94,21 @@ class GroqService:
     }
     """
 
+    USER_PROMPT = """Create a {style} style video script for the following content.
+        Break it down into 3-5 scenes.
+        
+        Content:
+        {text}
+        """
+
+    TEMPERATURE = 0.7
+
+    # Part of the script cache key, so editing the prompts or sampling
+    # settings doesn't keep serving scenes generated under the old ones
+    PROMPT_FINGERPRINT = hashlib.sha256(
+        f"{SYSTEM_PROMPT}|{USER_PROMPT}|{TEMPERATURE}".encode()
+    ).hexdigest()[:16]
+
     def __init__(self):
         """Initialize Groq client"""
         if not settings.GROQ_API_KEY:
@@ -61,7 +116,23 @@ class GroqService:
         
         self.client = Groq(api_key=settings.GROQ_API_KEY)
         self.model = settings.GROQ_MODEL
-        print(f"[GroqService] Initialized with model: {self.model}")
+        logger.info("Initialized with model: %s", self.model)
+
+        # Prime DNS/TLS and the connection pool off the request path
+        if settings.GROQ_WARMUP:
+            threading.Thread(target=self._warmup, daemon=True).start()
+
+    def _warmup(self):
+        """Send a 1-token completion so the first real call hits a warm connection"""
+        try:
+            self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1
+            )
+            logger.debug("Groq connection warmed up")
+        except Exception as e:
+            logger.debug("Groq warmup failed: %s", e)
 
     def generate_script_json(self, text: str, style: str = "documentary") -> List[Dict]:
         """
@@ -74,42 +145,66 @@ class GroqService:
         Returns:
             List of dicts: [{"narration": "...", "video_prompt": "..."}, ...]
         """
-        user_prompt = f"""Create a {style} style video script for the following content.
-        Break it down into 3-5 scenes.
+        cache_key = None
+        if _DCACHE is not None:
+            cache_key = hashlib.sha256(f"{self.model}|{self.PROMPT_FINGERPRINT}|{style}|{text}".encode()).hexdigest()
+            cached = _DCACHE.get(cache_key)
+            if cached is not None:
+                logger.debug("Script cache hit (%s)", cache_key[:12])
+                return cached
         
-        Content:
-        {text}
-        """
+        user_prompt = self.USER_PROMPT.format(style=style, text=text)
         
-        print(f"[GroqService] Generating script JSON with Groq ({self.model})...")
+        messages = [
+            {
+                "role": "system",
+                "content": self.SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": user_prompt
+            }
+        ]
         
+        logger.info("Generating script JSON with Groq (%s)...", self.model)
+        
+        from_groq = True
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self.SYSTEM_PROMPT
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt
-                    }
-                ],
-                model=self.model,
-                temperature=0.7,
-                max_tokens=self.SYSTEM_PROMPT.count(" ") + 2048, # Rough estimate
-                response_format={"type": "json_object"},
-                stream=False
-            )
+            try:
+                chat_completion = self.client.chat.completions.create(
+                    messages=messages,
+                    model=self.model,
+                    temperature=self.TEMPERATURE,
+                    max_tokens=self.SYSTEM_PROMPT.count(" ") + 2048, # Rough estimate
+                    response_format={"type": "json_object"},
+                    stream=False
+                )
+                content = chat_completion.choices[0].message.content.strip()
+            except (RateLimitError, APIError) as e:
+                # Degrade to the local model when Groq is rate limited or unreachable
+                local = _get_local_llm()
+                if local is None:
+                    raise
+                logger.warning("Groq unavailable (%s), falling back to local model", e)
+                from_groq = False
+                with _local_llm_infer_lock:
+                    completion = local.create_chat_completion(
+                        messages=messages,
+                        temperature=self.TEMPERATURE,
+                        response_format={"type": "json_object"}
+                    )
+                content = completion["choices"][0]["message"]["content"].strip()
             
-            content = chat_completion.choices[0].message.content.strip()
-            data = json.loads(content)
+            data = orjson.loads(content)
             
             scenes = data.get("scenes", [])
-            print(f"[GroqService] ✓ Generated {len(scenes)} scenes")
+            logger.debug("Generated %d scenes", len(scenes))
+            # Only cache Groq output so a fallback result isn't pinned once Groq recovers
+            if cache_key and scenes and from_groq:
+                _DCACHE.set(cache_key, scenes, expire=settings.GROQ_CACHE_TTL_SECONDS)
             return scenes
             
         except Exception as e:
-            logger.error(f"Groq Script generation failed: {e}")
+            logger.error("Groq Script generation failed: %s", e)
             raise RuntimeError(f"Groq Script generation failed: {e}")
 
@@ -5,13 +5,14 @@ Follows: https://developers.openai.com/api/docs/guides/video-generation
 - Create job (POST /videos) -> poll status (GET /videos/{id}) -> download MP4 (GET /videos/{id}/content)
 """
 import httpx
-from openai import OpenAI
+from openai import AsyncOpenAI, APIConnectionError, RateLimitError
 from config import settings
 import logging
 import asyncio
+import random
 import time
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 logger = logging.getLogger(__name__)
 
@@ -19,25 +20,192 @@ logger = logging.getLogger(__name__)
 SORA_RATE_LIMIT_MAX_RETRIES = 4
 SORA_RATE_LIMIT_INITIAL_WAIT = 15
 SORA_RATE_LIMIT_BACKOFF_FACTOR = 2
+SORA_RATE_LIMIT_MAX_WAIT = 120
+
+# Status polling: decorrelated-jitter backoff between polls (seconds)
+SORA_POLL_BASE_DELAY = 2.0
+SORA_POLL_MAX_DELAY = 30.0
+# Transient network errors tolerated while polling before giving up
+SORA_POLL_MAX_TRANSIENT_ERRORS = 5
+# With webhooks configured, still re-check this often in case a delivery is lost
+SORA_WEBHOOK_SAFETY_POLL = 60.0
+
+# Caps in-flight status requests across all concurrent jobs (avoids 429 cascades)
+_status_sem = asyncio.Semaphore(settings.SORA_MAX_CONCURRENT_STATUS_CALLS)
+
+# Substrings that mark a rate-limit error in wrapped/re-raised exception messages
+_RATE_LIMIT_TAGS = ("429", "rate limit", "rate_limit")
+
+
+def _is_rate_limit(err: Exception) -> bool:
+    if isinstance(err, RateLimitError):
+        return True
+    msg = str(err).lower()
+    return any(tag in msg for tag in _RATE_LIMIT_TAGS)
+
+
+def _compute_backoff(attempt: int, err: Exception) -> float:
+    """
+    Seconds to wait before retrying a rate-limited request.
+    
+    Honors a numeric Retry-After header when the API sends one (capped at
+    SORA_RATE_LIMIT_MAX_WAIT); otherwise exponential backoff plus jitter so
+    concurrent jobs don't retry in lockstep.
+    """
+    response = getattr(err, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(SORA_RATE_LIMIT_MAX_WAIT, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    wait = min(SORA_RATE_LIMIT_MAX_WAIT, SORA_RATE_LIMIT_INITIAL_WAIT * (SORA_RATE_LIMIT_BACKOFF_FACTOR ** attempt))
+    return wait + random.uniform(0, wait * 0.25)
 
-# Poll interval (guide: "every 10–20 seconds")
-SORA_POLL_INTERVAL = 10
 
 class OpenAIService:
     def __init__(self):
         if not settings.OPENAI_API_KEY:
             raise RuntimeError("OPENAI_API_KEY is not configured")
 
-        # Use a custom httpx client to avoid OpenAI SDK passing 'proxies' (incompatible with httpx 0.28+)
-        _http_client = httpx.Client()
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY, http_client=_http_client)
+        # Use a custom httpx client to avoid OpenAI SDK passing 'proxies' (incompatible with httpx 0.28+).
+        # HTTP/2 + a long keep-alive lets the status polls for every in-flight job
+        # share a warm connection instead of renegotiating TLS.
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=64,
+                max_keepalive_connections=32,
+                keepalive_expiry=300
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, http_client=_http_client)
         self.model = settings.SORA_MODEL
-        print(f"[OpenAIService] Initialized with model: {self.model}")
 
-    def generate_video_clip(self, prompt: str, size: str = "1280x720", duration_seconds: int = 5) -> str:
+        # Caps Sora jobs in flight across all requests (account concurrency limit)
+        self._jobs_sem = asyncio.Semaphore(settings.SORA_CONCURRENCY)
+
+        # video_id -> event set by the /webhooks/openai route
+        self._video_events: Dict[str, asyncio.Event] = {}
+        logger.info("Initialized with model: %s", self.model)
+
+    async def warmup(self):
+        """Prime DNS/TLS and the keep-alive pool with a cheap authenticated GET"""
+        try:
+            await self.client.models.retrieve(self.model)
+            logger.debug("OpenAI connection warmed up")
+        except Exception as e:
+            logger.debug("OpenAI warmup failed: %s", e)
+
+    def notify_video_event(self, video_id: str):
+        """Wake the poller waiting on video_id (called when a webhook arrives)"""
+        event = self._video_events.get(video_id)
+        if event is not None:
+            event.set()
+
+    async def _wait_for_completion(self, video_id: str):
+        """
+        Wait until the Sora job finishes.
+        
+        Sleeps between polls on a per-video event, so notify_video_event()
+        (webhook or cancel) wakes it immediately. With OPENAI_WEBHOOK_SECRET
+        set the sleep is a slow safety poll; otherwise it backs off with jitter.
+        Raises RuntimeError if the job failed.
+        """
+        wake = asyncio.Event()
+        self._video_events[video_id] = wake
+
+        started = time.monotonic()
+        delay = SORA_POLL_BASE_DELAY
+        last_status = None
+        transient_errors = 0
+        rate_limited = 0
+        try:
+            while True:
+                try:
+                    async with _status_sem:
+                        job = await self.client.videos.retrieve(video_id)
+                except RateLimitError as e:
+                    # The job keeps rendering; back off and poll the same id again
+                    if rate_limited >= SORA_RATE_LIMIT_MAX_RETRIES:
+                        raise
+                    wait = _compute_backoff(rate_limited, e)
+                    rate_limited += 1
+                    logger.warning(
+                        "Sora status poll rate limited (%d/%d), retrying in %.1fs",
+                        rate_limited, SORA_RATE_LIMIT_MAX_RETRIES, wait
+                    )
+                    await asyncio.sleep(wait)
+                    continue
+                except APIConnectionError as e:
+                    transient_errors += 1
+                    if transient_errors > SORA_POLL_MAX_TRANSIENT_ERRORS:
+                        raise
+                    logger.warning(
+                        "Sora status poll failed (%d/%d), retrying: %s",
+                        transient_errors, SORA_POLL_MAX_TRANSIENT_ERRORS, e
+                    )
+                else:
+                    rate_limited = 0
+                    if job.status == "completed":
+                        break
+                    if job.status == "failed":
+                        err = getattr(job, "error", None)
+                        message = getattr(err, "message", "Video generation failed") if err else "Video generation failed"
+                        code = getattr(err, "code", "unknown") if err else "unknown"
+                        raise RuntimeError(f"Sora job failed: {code} - {message}")
+                    if job.status != last_status:
+                        # Progress (e.g. queued -> in_progress): poll closely again
+                        last_status = job.status
+                        delay = SORA_POLL_BASE_DELAY
+
+                if settings.OPENAI_WEBHOOK_SECRET:
+                    timeout = SORA_WEBHOOK_SAFETY_POLL
+                else:
+                    # Decorrelated jitter: spreads polls out as the render drags on
+                    delay = min(SORA_POLL_MAX_DELAY, random.uniform(SORA_POLL_BASE_DELAY, delay * 3))
+                    timeout = delay
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                wake.clear()
+        finally:
+            self._video_events.pop(video_id, None)
+
+        logger.info("Sora job %s completed in %.0fs", video_id, time.monotonic() - started)
+
+    async def _run_job(self, video_id: str, output_dir: Path) -> str:
+        """Wait for a created Sora job and download the MP4. Returns the local path."""
+        # Wait until completed or failed (no timeout; Sora can take several minutes)
+        await self._wait_for_completion(video_id)
+
+        # Download the MP4 (guide: GET /videos/{id}/content), streamed to disk
+        # so the whole clip is never held in memory
+        file_path = output_dir / f"{video_id}.mp4"
+        for attempt in range(SORA_RATE_LIMIT_MAX_RETRIES):
+            try:
+                async with self.client.videos.with_streaming_response.download_content(video_id, variant="video") as response:
+                    await response.stream_to_file(file_path)
+                break
+            except RateLimitError as e:
+                # The render is done; only the download needs repeating
+                if attempt == SORA_RATE_LIMIT_MAX_RETRIES - 1:
+                    raise
+                wait = _compute_backoff(attempt, e)
+                logger.warning(
+                    "Sora download rate limited (%d/%d), retrying in %.1fs",
+                    attempt + 1, SORA_RATE_LIMIT_MAX_RETRIES, wait
+                )
+                await asyncio.sleep(wait)
+
+        return str(file_path)
+
+    async def generate_video_clip(self, prompt: str, size: str = "1280x720", duration_seconds: int = 5) -> str:
         """
         Generate a single video clip using Sora.
-        Blocking call (sync) - should be run in executor or thread.
+        Natively async - waiting on a render holds no thread.
         
         Args:
             prompt: detailed visual description
@@ -50,11 +218,7 @@ class OpenAIService:
         # Clamp duration to available buckets if needed, or rely on API validation
         # Sora typically supports specific increments
         
-        print(f"[OpenAIService] Generating clip for prompt: {prompt[:50]}...")
-
-        def _is_rate_limit(err: Exception) -> bool:
-            msg = str(err).lower()
-            return "429" in msg or "rate limit" in msg or "rate_limit" in msg
+        logger.info("Generating clip for prompt: %.50s...", prompt)
 
         # Map arbitrary duration to Sora's supported buckets: 4, 8, 12
         if duration_seconds <= 4:
@@ -71,54 +235,40 @@ class OpenAIService:
 
         for attempt in range(SORA_RATE_LIMIT_MAX_RETRIES):
             try:
-                # Kick off a video job (returns a job object with .id, .status; no .url)
-                video_job = self.client.videos.create(
-                    model=self.model,
-                    prompt=prompt,
-                    size=size,
-                    seconds=sora_seconds,
-                )
-                video_id = getattr(video_job, "id", None)
-                if not video_id:
-                    raise RuntimeError("Sora create() did not return a job id")
-
-                # Poll until completed or failed (no timeout; Sora can take several minutes)
-                while True:
-                    job = self.client.videos.retrieve(video_id)
-                    if job.status == "completed":
-                        break
-                    if job.status == "failed":
-                        err = getattr(job, "error", None)
-                        message = getattr(err, "message", "Video generation failed") if err else "Video generation failed"
-                        code = getattr(err, "code", "unknown") if err else "unknown"
-                        raise RuntimeError(f"Sora job failed: {code} - {message}")
-
-                    time.sleep(SORA_POLL_INTERVAL)
-
-                # Download the MP4 (guide: GET /videos/{id}/content, then write_to_file)
-                content = self.client.videos.download_content(video_id, variant="video")
-                file_path = output_dir / f"{video_id}.mp4"
-                content.write_to_file(str(file_path))
-
-                return str(file_path)
+                # Only the job itself holds a slot; rate-limit backoff sleeps outside it
+                async with self._jobs_sem:
+                    # Kick off a video job (returns a job object with .id, .status; no .url)
+                    try:
+                        video_job = await self.client.videos.create(
+                            model=self.model,
+                            prompt=prompt,
+                            size=size,
+                            seconds=sora_seconds,
+                        )
+                    except Exception as e:
+                        if not _is_rate_limit(e) or attempt == SORA_RATE_LIMIT_MAX_RETRIES - 1:
+                            raise
+                        create_error = e
+                    else:
+                        video_id = getattr(video_job, "id", None)
+                        if not video_id:
+                            raise RuntimeError("Sora create() did not return a job id")
+                        # Later 429s are retried against this id, never by resubmitting
+                        return await self._run_job(video_id, output_dir)
 
             except Exception as e:
-                if _is_rate_limit(e) and attempt < SORA_RATE_LIMIT_MAX_RETRIES - 1:
-                    wait = SORA_RATE_LIMIT_INITIAL_WAIT * (SORA_RATE_LIMIT_BACKOFF_FACTOR ** attempt)
-                    logger.warning(
-                        f"Sora rate limited (429), retry {attempt + 1}/{SORA_RATE_LIMIT_MAX_RETRIES} in {wait}s: {e}"
-                    )
-                    time.sleep(wait)
-                else:
-                    logger.error(f"Sora generation failed: {e}")
-                    raise RuntimeError(f"Sora generation failed: {e}")
+                logger.error("Sora generation failed: %s", e)
+                raise RuntimeError(f"Sora generation failed: {e}")
+
+            wait = _compute_backoff(attempt, create_error)
+            logger.warning(
+                "Sora rate limited (429), retry %d/%d in %.1fs: %s",
+                attempt + 1, SORA_RATE_LIMIT_MAX_RETRIES, wait, create_error
+            )
+            await asyncio.sleep(wait)
 
     async def generate_scene_video(self, scene_prompt: str) -> str:
         """
-        Async wrapper for video generation
+        Generate the video clip for one scene
         """
-        # Run blocking OpenAI call in thread pool
-        # For Sora, generation might take 10-60s or be async polling
-        # This is a simplified "create" call assumption
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.generate_video_clip, scene_prompt)
+        return await self.generate_video_clip(scene_prompt)
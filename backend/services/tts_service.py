@@ -4,12 +4,53 @@ Generates high-quality mp3 audio from text.
 """
 import edge_tts
 import asyncio
+import hashlib
+import os
+import re
+import shutil
+import uuid
 from pathlib import Path
 import logging
+from typing import List
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Narration longer than this is split at sentence boundaries and synthesized concurrently
+TTS_CHUNK_CHARS = 500
+# Concurrent EdgeTTS sessions per service (keeps us under Azure's rate limits)
+TTS_MAX_CONCURRENT_CHUNKS = 8
+
+# Content-addressed cache of generated narration (voice + text -> mp3)
+TTS_CACHE_MAX_ENTRIES = 500
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def _split_text(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """Group whole sentences into chunks of roughly max_chars"""
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_SPLIT_RE.split(text.strip()):
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """Hard-link src to dst (no data copy), falling back to a copy across filesystems"""
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
 class TTSService:
     def __init__(self):
         # Voice constants
@@ -21,6 +62,35 @@ class TTSService:
         self.output_dir = settings.TEMP_DIR / "audio"
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
+        self._chunk_sem = asyncio.Semaphore(TTS_MAX_CONCURRENT_CHUNKS)
+        
+        self._cache_dir = settings.TEMP_DIR / "tts_cache"
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        
+    def _cache_path(self, text: str, voice: str) -> Path:
+        key = hashlib.blake2b(f"{voice}\0{text}".encode(), digest_size=16).hexdigest()
+        return self._cache_dir / f"{key}.mp3"
+        
+    def _store_in_cache(self, output_path: Path, cache_path: Path):
+        """Add a freshly generated file to the cache and evict least-recently-used entries"""
+        try:
+            _link_or_copy(output_path, cache_path)
+            entries = sorted(self._cache_dir.glob("*.mp3"), key=lambda p: p.stat().st_mtime)
+            for stale in entries[:-TTS_CACHE_MAX_ENTRIES]:
+                stale.unlink(missing_ok=True)
+        except OSError as e:
+            logger.debug("TTS cache store failed: %s", e)
+        
+    async def _synthesize(self, text: str, voice: str) -> bytes:
+        """Synthesize one chunk of text to MP3 bytes"""
+        async with self._chunk_sem:
+            communicate = edge_tts.Communicate(text, voice)
+            audio = bytearray()
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    audio += chunk["data"]
+            return bytes(audio)
+        
     async def generate_audio(self, text: str, voice: str = "en-US-GuyNeural", file_name: str = "output.mp3") -> Path:
         """
         Generate MP3 audio from text.
@@ -37,21 +107,48 @@ class TTSService:
             raise ValueError("TTS text cannot be empty")
             
         output_path = self.output_dir / file_name
+        cache_path = self._cache_path(text, voice)
         
-        print(f"[TTSService] Generating audio: {text[:30]}... ({voice})")
+        if cache_path.exists():
+            try:
+                os.utime(cache_path)  # Mark as recently used
+                _link_or_copy(cache_path, output_path)
+                logger.debug("TTS cache hit: %.30s... (%s)", text, voice)
+                return output_path
+            except FileNotFoundError:
+                # Evicted by a concurrent store between the check and the link
+                logger.debug("TTS cache entry vanished, regenerating: %.30s... (%s)", text, voice)
         
+        logger.debug("Generating audio: %.30s... (%s)", text, voice)
+        
+        # Write to a temp file and rename it into place: output_path may be a
+        # hard link to a cache entry, and opening it for writing would clobber it
+        tmp_path = output_path.with_name(f"{output_path.name}.{uuid.uuid4().hex[:8]}.part")
         try:
-            communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(str(output_path))
+            chunks = _split_text(text) if len(text) > TTS_CHUNK_CHARS else [text]
+            if len(chunks) == 1:
+                communicate = edge_tts.Communicate(text, voice)
+                await communicate.save(str(tmp_path))
+            else:
+                # EdgeTTS emits raw MP3 frames in a fixed format, so the
+                # chunks can be joined byte-for-byte without re-encoding
+                parts = await asyncio.gather(*(self._synthesize(c, voice) for c in chunks))
+                tmp_path.write_bytes(b"".join(parts))
             
-            if not output_path.exists() or output_path.stat().st_size == 0:
+            if not tmp_path.exists() or tmp_path.stat().st_size == 0:
                  raise RuntimeError("TTS Output file is empty or missing")
-                 
+            
+            os.replace(tmp_path, output_path)
+            # The eviction scan stats every entry; keep it off the event loop
+            await asyncio.to_thread(self._store_in_cache, output_path, cache_path)
             return output_path
             
         except Exception as e:
-            logger.error(f"TTS Generation failed: {e}")
+            logger.error("TTS Generation failed: %s", e)
             raise RuntimeError(f"TTS Generation failed: {e}")
+        
+        finally:
+            tmp_path.unlink(missing_ok=True)
             
     def get_voices(self):
         """Return list of available basic voices"""
@@ -1,102 +1,330 @@
 """
 Video Composer Service
 Stitches Video Clips (MP4) and Audio (MP3) into final video.
+
+Everything runs in FFmpeg: a stream-copy concat when the clips already fit,
+otherwise a single filter graph (loop/trim/concat + one encode), so frames never
+pass through Python.
 """
-from moviepy import VideoFileClip, AudioFileClip, concatenate_videoclips
-from moviepy.video.fx.Loop import Loop
 from pathlib import Path
+import asyncio
+import functools
 import logging
-from typing import List, Dict
+import os
+import subprocess
+import orjson
+from typing import List, Dict, Tuple, Optional
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+# Hardware H.264 encoders in order of preference: (codec, preset, extra ffmpeg params)
+# Each runs in constant-quality mode, roughly matching x264 CRF 23
+HW_ENCODERS = [
+    ("h264_nvenc", "p4", ["-tune", "hq", "-rc", "vbr", "-cq", "23", "-b:v", "0"]),
+    ("h264_videotoolbox", None, ["-q:v", "50"]),
+    ("h264_qsv", "veryfast", ["-global_quality", "23"]),
+    ("h264_amf", None, ["-quality", "speed", "-rc", "cqp", "-qp_i", "23", "-qp_p", "23"]),
+]
+
+OUTPUT_FPS = 24
+PREPARE_CONCURRENCY = 8  # Scenes probed at once
+AUDIO_FORMAT = "aformat=sample_fmts=fltp:sample_rates=44100:channel_layouts=stereo"
+
+
+def _encoder_works(codec: str) -> bool:
+    """Encode a single frame to confirm the encoder initializes (GPU/driver present)"""
+    cmd = [
+        settings.FFMPEG_BINARY, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1",
+        "-frames:v", "1", "-c:v", codec, "-f", "null", "-"
+    ]
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=15).returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def h264_encoder() -> Tuple[str, Optional[str], List[str]]:
+    """Detect the fastest usable H.264 encoder once per process"""
+    try:
+        listing = subprocess.run(
+            [settings.FFMPEG_BINARY, "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=15
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        listing = ""
+
+    for codec, preset, params in HW_ENCODERS:
+        if codec in listing and _encoder_works(codec):
+            logger.info("Using hardware encoder: %s", codec)
+            return codec, preset, params
+
+    logger.info("No hardware encoder available, using libx264 (%s)", settings.X264_PRESET)
+    # Short AI clips don't benefit from B-frames; one thread per vCPU
+    return "libx264", settings.X264_PRESET, [
+        "-crf", str(settings.X264_CRF),
+        "-threads", str(os.cpu_count() or 0),
+        "-bf", "0",
+    ]
+
+
+def probe_media(path: str) -> Dict:
+    """
+    Duration plus first video/audio stream info via ffprobe (reads container headers only).
+
+    Returns {"duration": float, "video": {...}, "audio": {...}}; stream keys are
+    absent when the file has no such stream. Results are cached per file version,
+    so retries and clips reused across scenes don't re-probe. Treat as read-only.
+    """
+    stat = os.stat(path)
+    return _probe_media_cached(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=64)
+def _probe_media_cached(path: str, mtime_ns: int, size: int) -> Dict:
+    """probe_media keyed on (path, mtime, size) so rewritten files are probed again"""
+    result = subprocess.run(
+        [
+            settings.FFPROBE_BINARY, "-v", "error",
+            "-show_entries", "format=duration:stream=codec_type,codec_name,width,height",
+            "-of", "json", str(path)
+        ],
+        capture_output=True, check=True
+    )
+    data = orjson.loads(result.stdout)
+    info = {"duration": float(data["format"]["duration"])}
+    for stream in data.get("streams", []):
+        info.setdefault(stream.get("codec_type"), stream)
+    return info
+
+
+def _write_concat_list(paths: List[str], list_path: Path):
+    """Write an ffmpeg concat-demuxer list file"""
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = str(Path(path).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+
+def _output_size(prepared: List[Dict]) -> Tuple[int, int]:
+    """Frame size of the first clip (Sora renders every scene at the requested size)"""
+    for scene in prepared:
+        video = scene["video"].get("video", {})
+        if video.get("width") and video.get("height"):
+            return int(video["width"]), int(video["height"])
+    return settings.DEFAULT_VIDEO_WIDTH, settings.DEFAULT_VIDEO_HEIGHT
+
+
 class VideoComposer:
     def __init__(self):
         self.output_dir = settings.OUTPUT_DIR
-        
-    def compose_video(self, scenes: List[Dict], job_id: str) -> str:
+
+    async def _prepare_scene(self, index: int, scene: Dict, sem: asyncio.Semaphore) -> Optional[Dict]:
+        """Probe the scene's media"""
+        video_path = scene.get('video_path')
+        audio_path = scene.get('audio_path')
+
+        if not video_path:
+            logger.warning("Scene %d missing video, skipping...", index)
+            return None
+
+        async with sem:
+            video_info = await asyncio.to_thread(probe_media, video_path)
+            audio_info = await asyncio.to_thread(probe_media, audio_path) if audio_path else None
+
+        return {
+            "video_path": video_path,
+            "audio_path": audio_path,
+            "video": video_info,
+            "audio": audio_info,
+        }
+
+    def _can_stream_copy(self, prepared: List[Dict], size: Tuple[int, int]) -> bool:
+        """
+        True when the clips can be joined without re-encoding video: all H.264 at
+        the output size, and either no scene has narration (clips carry their own
+        AAC audio) or every narration matches its clip length to within a frame.
+        """
+        narrated = {scene["audio"] is not None for scene in prepared}
+        if len(narrated) != 1:
+            return False
+
+        for scene in prepared:
+            video = scene["video"].get("video", {})
+            if video.get("codec_name") != "h264":
+                return False
+            if (video.get("width"), video.get("height")) != size:
+                return False
+            if scene["audio"] is None:
+                if scene["video"].get("audio", {}).get("codec_name") != "aac":
+                    return False
+            elif abs(scene["audio"]["duration"] - scene["video"]["duration"]) > 1 / OUTPUT_FPS:
+                return False
+        return True
+
+    def _stream_copy_command(self, prepared: List[Dict], output_path: Path, job_id: str) -> List[str]:
+        """Concat-demuxer command: container rewrite only, narration (if any) encoded to AAC"""
+        video_list = settings.TEMP_DIR / f"concat_{job_id}_video.txt"
+        _write_concat_list([scene["video_path"] for scene in prepared], video_list)
+        cmd = [
+            settings.FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", str(video_list),
+        ]
+
+        if prepared[0]["audio"] is None:
+            cmd += ["-c", "copy"]
+        else:
+            audio_list = settings.TEMP_DIR / f"concat_{job_id}_audio.txt"
+            _write_concat_list([scene["audio_path"] for scene in prepared], audio_list)
+            cmd += [
+                "-f", "concat", "-safe", "0", "-i", str(audio_list),
+                "-map", "0:v", "-map", "1:a",
+                "-c:v", "copy", "-c:a", "aac",
+            ]
+
+        return cmd + ["-movflags", "+faststart", str(output_path)]
+
+    def _filter_command(self, prepared: List[Dict], output_path: Path, size: Tuple[int, int]) -> List[str]:
+        """Single filter graph: loop/trim each clip to its narration, normalize, concat, encode once"""
+        width, height = size
+        # concat needs identical geometry/fps; letterbox like MoviePy's "compose" did
+        normalize = (
+            f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={OUTPUT_FPS}"
+        )
+
+        inputs: List[str] = []
+        filters: List[str] = []
+        input_idx = 0
+
+        for n, scene in enumerate(prepared):
+            if scene["audio"] is not None:
+                # Video follows the narration: loop the clip if it's shorter,
+                # cut it if it's longer
+                duration = scene["audio"]["duration"]
+                inputs += ["-stream_loop", "-1", "-i", str(scene["video_path"]), "-i", str(scene["audio_path"])]
+                v_in, a_in = input_idx, input_idx + 1
+                input_idx += 2
+                filters.append(
+                    f"[{v_in}:v]trim=duration={duration:.3f},setpts=PTS-STARTPTS,{normalize}[v{n}]"
+                )
+                filters.append(
+                    f"[{a_in}:a]atrim=0:{duration:.3f},asetpts=PTS-STARTPTS,{AUDIO_FORMAT}[a{n}]"
+                )
+            else:
+                # No narration: keep the clip as-is with its own audio
+                # (padded/cut to the clip length), or silence if it has none
+                duration = scene["video"]["duration"]
+                inputs += ["-i", str(scene["video_path"])]
+                v_in = input_idx
+                input_idx += 1
+                filters.append(f"[{v_in}:v]setpts=PTS-STARTPTS,{normalize}[v{n}]")
+                if "audio" in scene["video"]:
+                    filters.append(
+                        f"[{v_in}:a]asetpts=PTS-STARTPTS,apad,atrim=0:{duration:.3f},{AUDIO_FORMAT}[a{n}]"
+                    )
+                else:
+                    filters.append(f"anullsrc=r=44100:cl=stereo,atrim=0:{duration:.3f},{AUDIO_FORMAT}[a{n}]")
+
+        # Concatenate all scenes
+        streams = "".join(f"[v{k}][a{k}]" for k in range(len(prepared)))
+        filters.append(f"{streams}concat=n={len(prepared)}:v=1:a=1[v][a]")
+
+        codec, preset, codec_params = h264_encoder()
+        return [
+            settings.FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+            *inputs,
+            "-filter_complex", ";".join(filters),
+            "-map", "[v]", "-map", "[a]",
+            "-c:v", codec,
+            *(["-preset", preset] if preset else []),
+            *codec_params,
+            "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            "-movflags", "+faststart",
+            str(output_path)
+        ]
+
+    def _make_thumbnail(self, output_path: Path, job_id: str) -> Optional[str]:
+        """Grab the first frame as a JPEG; a missing thumbnail never fails the job"""
+        thumb_filename = f"strang_{job_id}_thumb.jpg"
+        cmd = [
+            settings.FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error",
+            "-ss", "0", "-i", str(output_path),
+            "-frames:v", "1", "-q:v", "3",
+            str(self.output_dir / thumb_filename)
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.warning("Thumbnail extraction failed: %s", result.stderr.strip()[-300:])
+            return None
+        return f"/outputs/{thumb_filename}"
+
+    async def compose_video(self, scenes: List[Dict], job_id: str) -> Tuple[str, Optional[str]]:
         """
         Compose final video from a list of scene dictionaries.
-        
+
+        Scenes are probed concurrently. Clips that already match their
+        narration are joined with a stream copy; otherwise each clip is looped or
+        trimmed to its narration length, scaled/padded to the first clip's size, and
+        all scenes are concatenated and encoded in one ffmpeg invocation.
+
         Args:
             scenes: List of dicts, each containing:
-                - video_path: Path/URL to local MP4 clip
+                - video_path: Path to local MP4 clip
                 - audio_path: Path to local MP3 audio
             job_id: Unique Job ID
-            
+
         Returns:
-            Path string to the final video
+            (video URL path, thumbnail URL path or None)
         """
-        print(f"[VideoComposer] Composing {len(scenes)} scenes...")
-        
-        final_clips = []
-        
+        logger.info("Composing %d scenes...", len(scenes))
+
         try:
-            for i, scene in enumerate(scenes):
-                video_path = scene.get('video_path')
-                audio_path = scene.get('audio_path')
-                
-                if not video_path:
-                    logger.warning(f"Scene {i} missing video, skipping...")
-                    continue
-                    
-                # Load Video
-                # Note: If video_path is a URL, moviepy might not handle it directly optimally.
-                # Ideally, we should double check these are local paths.
-                # Assuming caller performs download if needed.
-                clip = VideoFileClip(str(video_path))
-                
-                # Load Audio if present
-                if audio_path:
-                    audio = AudioFileClip(str(audio_path))
-                    # Set video duration to match audio (loop or cut video?)
-                    # For Sora clips (e.g. 5s), if audio is long (10s), we loop or reverse-loop
-                    # If audio is short, we cut video.
-                    
-                    if audio.duration > clip.duration:
-                        # Loop video to match audio (MoviePy 2.x: use Loop effect)
-                        clip = clip.with_effects([Loop(duration=audio.duration)])
-                    else:
-                        # Trim video to match audio (MoviePy 2.x: subclipped)
-                        clip = clip.subclipped(0, audio.duration)
-
-                    clip = clip.with_audio(audio)
-                
-                final_clips.append(clip)
-            
-            if not final_clips:
+            sem = asyncio.Semaphore(PREPARE_CONCURRENCY)
+            results = await asyncio.gather(
+                *(self._prepare_scene(i, scene, sem) for i, scene in enumerate(scenes))
+            )
+            prepared = [scene for scene in results if scene is not None]
+
+            if not prepared:
                 raise RuntimeError("No valid clips to compose")
-                
-            # Concatenate all scenes
-            final_video = concatenate_videoclips(final_clips, method="compose")
-            
+
             output_filename = f"strang_{job_id}.mp4"
             output_path = self.output_dir / output_filename
-            
-            # Write file
-            final_video.write_videofile(
-                str(output_path),
-                fps=24,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile='temp-audio.m4a',
-                remove_temp=True,
-                logger=None # Silence standard logger
-            )
-            
-            print(f"[VideoComposer] ✓ Video rendered: {output_path}")
-            return f"/outputs/{output_filename}"
-            
+
+            # Keep the clips' native resolution rather than rescaling every scene
+            size = _output_size(prepared)
+            if self._can_stream_copy(prepared, size):
+                logger.info("Clips already match, joining with stream copy")
+                cmd = self._stream_copy_command(prepared, output_path, job_id)
+            else:
+                # First use runs encoder detection (ffmpeg trial encodes); keep it off the loop
+                cmd = await asyncio.to_thread(self._filter_command, prepared, output_path, size)
+
+            # Write file (single encode, off the event loop). subprocess.run kills
+            # ffmpeg on timeout, so a stalled encode can't pin the job forever
+            try:
+                result = await asyncio.to_thread(
+                    subprocess.run, cmd, capture_output=True, text=True,
+                    timeout=settings.COMPOSE_TIMEOUT_S
+                )
+            except subprocess.TimeoutExpired:
+                output_path.unlink(missing_ok=True)
+                raise RuntimeError(f"ffmpeg timed out after {settings.COMPOSE_TIMEOUT_S}s")
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with {result.returncode}: {result.stderr.strip()[-500:]}")
+
+            logger.info("Video rendered: %s", output_path)
+            thumbnail_url = await asyncio.to_thread(self._make_thumbnail, output_path, job_id)
+            return f"/outputs/{output_filename}", thumbnail_url
+
         except Exception as e:
-            logger.error(f"Composition failed: {e}")
+            logger.error("Composition failed: %s", e)
             raise RuntimeError(f"Composition failed: {e}")
+
         finally:
-            # Cleanup resources
-            # MoviePy often leaves handles open, explicit close helps
-            try:
-                for clip in final_clips:
-                    clip.close()
-                    if clip.audio: clip.audio.close()
-            except:
-                pass
+            for kind in ("video", "audio"):
+                (settings.TEMP_DIR / f"concat_{job_id}_{kind}.txt").unlink(missing_ok=True)
@@ -2,13 +2,34 @@
 Job manager for async video generation with progress tracking
 """
 import asyncio
-from typing import Dict, Optional, Callable, Set
+import concurrent.futures
+import contextlib
+import functools
+import logging
+from typing import Dict, List, Optional, Callable, Set
 from datetime import datetime
 import uuid
+import orjson
+from cachetools import TTLCache
+from config import settings
 from models import JobStatus, JobProgress, VideoResult
 from pathlib import Path
 from fastapi import WebSocket
 
+logger = logging.getLogger(__name__)
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+JOB_KEY = "strang:job:{}"
+RESULT_KEY = "strang:result:{}"
+PROGRESS_CHANNEL = "strang:progress:"
+SEND_TIMEOUT_SECONDS = 2.0  # Per-client WebSocket send timeout before eviction
+RELAY_RETRY_SECONDS = 1.0   # Pause before resubscribing after a Redis pub/sub failure
+MAX_TRACKED_JOBS = 10_000   # Per-process cap on jobs/results kept in memory
+
 
 class ConnectionManager:
     """Manage WebSocket connections for real-time progress updates"""
@@ -27,7 +48,7 @@ class ConnectionManager:
         self.active_connections[job_id].add(websocket)
         self.connection_jobs[websocket] = job_id
         
-        print(f"[WebSocket] Client connected to job {job_id[:8]}")
+        logger.debug("WebSocket client connected to job %s", job_id[:8])
     
     def disconnect(self, websocket: WebSocket):
         """Disconnect a client"""
@@ -42,37 +63,166 @@ class ConnectionManager:
                     del self.active_connections[job_id]
             
             del self.connection_jobs[websocket]
-            print(f"[WebSocket] Client disconnected from job {job_id[:8]}")
+            logger.debug("WebSocket client disconnected from job %s", job_id[:8])
     
     async def broadcast_to_job(self, job_id: str, message: dict):
         """Broadcast a message to all clients watching a specific job"""
         if job_id not in self.active_connections:
             return
         
-        disconnected = set()
+        # Encode once for every client instead of send_json per socket
+        await self.broadcast_text(job_id, orjson.dumps(message).decode())
+    
+    async def broadcast_text(self, job_id: str, payload: str):
+        """Send an already-encoded JSON payload to all clients watching a job"""
+        if job_id not in self.active_connections:
+            return
         
-        for connection in self.active_connections[job_id]:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"[WebSocket] Error sending to client: {e}")
-                disconnected.add(connection)
+        # Send to everyone at once; a slow or stuck client only costs its own timeout
+        connections = list(self.active_connections[job_id])
+        results = await asyncio.gather(
+            *(asyncio.wait_for(c.send_text(payload), timeout=SEND_TIMEOUT_SECONDS) for c in connections),
+            return_exceptions=True
+        )
         
-        # Clean up disconnected clients
-        for connection in disconnected:
-            self.disconnect(connection)
+        # Clean up disconnected clients. Close them too: a timed-out send may be
+        # half-written, and the client would otherwise sit connected but deaf
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.debug("Error sending to WebSocket client: %r", result)
+                self.disconnect(connection)
+                with contextlib.suppress(Exception):
+                    await asyncio.wait_for(connection.close(code=1011), timeout=SEND_TIMEOUT_SECONDS)
 
 
 class JobManager:
     """Manage async video generation jobs"""
     
     def __init__(self):
-        self.jobs: Dict[str, JobProgress] = {}
-        self.results: Dict[str, VideoResult] = {}
-        self.tasks: Dict[str, asyncio.Task] = {}
+        # Bounded and time-limited so a long-running server doesn't accumulate
+        # every job it has ever run
+        ttl = settings.MAX_VIDEO_AGE_HOURS * 3600
+        self.jobs: Dict[str, JobProgress] = TTLCache(maxsize=MAX_TRACKED_JOBS, ttl=ttl)
+        self.results: Dict[str, VideoResult] = TTLCache(maxsize=MAX_TRACKED_JOBS, ttl=ttl)
+        self.tasks: Dict[str, asyncio.Task] = {}  # Running jobs only
+        # Own pool so long sync jobs can't starve the loop's default executor
+        self.job_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.MAX_CONCURRENT_JOBS,
+            thread_name_prefix="strang-job"
+        )
         self.connection_manager = ConnectionManager()
+        # Optional shared store; local dicts stay as the write-through copy for
+        # jobs running in this process
+        self.redis = None
+        self._listener: Optional[asyncio.Task] = None
+        # Updates are persisted/broadcast by one consumer task, in order.
+        # Each queue entry is (job_id, [message]); a queued progress slot is
+        # overwritten in place by newer progress for the same job.
+        self._broadcast_queue: asyncio.Queue = asyncio.Queue()
+        self._pending_progress: Dict[str, List[dict]] = {}
+        self._broadcaster: Optional[asyncio.Task] = None
+    
+    async def connect_store(self):
+        """Connect to Redis (if enabled) and start relaying progress from other workers"""
+        if not settings.REDIS_ENABLED:
+            return
+        if aioredis is None:
+            logger.warning("REDIS_ENABLED but redis is not installed; using in-memory store")
+            return
+        
+        self.redis = aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            db=settings.REDIS_DB
+        )
+        await self.redis.ping()
+        self._listener = asyncio.create_task(self._relay_progress())
+        logger.info("Using Redis job store at %s:%s", settings.REDIS_HOST, settings.REDIS_PORT)
+    
+    async def close_store(self):
+        """Stop the pub/sub relay and close the Redis connection"""
+        if self._listener:
+            self._listener.cancel()
+            self._listener = None
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+    
+    async def _relay_progress(self):
+        """Deliver every worker's published updates to this worker's WebSocket clients"""
+        # Resubscribe after connection drops so cross-worker updates keep flowing
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{PROGRESS_CHANNEL}*")
+                async for msg in pubsub.listen():
+                    if msg["type"] != "pmessage":
+                        continue
+                    job_id = msg["channel"].decode()[len(PROGRESS_CHANNEL):]
+                    # Already JSON from the publisher; forward without re-encoding
+                    await self.connection_manager.broadcast_text(job_id, msg["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Redis progress relay failed (%s), resubscribing in %ss", e, RELAY_RETRY_SECONDS)
+                await asyncio.sleep(RELAY_RETRY_SECONDS)
+            finally:
+                with contextlib.suppress(Exception):
+                    await pubsub.aclose()
+    
+    def _ttl(self) -> int:
+        return settings.MAX_VIDEO_AGE_HOURS * 3600
     
-    def create_job(self) -> str:
+    async def _save(self, key: str, model):
+        if self.redis is not None:
+            await self.redis.set(key, model.model_dump_json(), ex=self._ttl())
+    
+    async def _publish(self, job_id: str, message: dict):
+        """Send an update to WebSocket clients, across workers when Redis is on"""
+        if self.redis is not None:
+            await self.redis.publish(f"{PROGRESS_CHANNEL}{job_id}", orjson.dumps(message))
+        else:
+            await self.connection_manager.broadcast_to_job(job_id, message)
+    
+    def _enqueue(self, job_id: str, message: dict, coalesce: bool = False):
+        """Queue an update for the broadcaster, starting it on first use"""
+        if self._broadcaster is None or self._broadcaster.done():
+            self._broadcaster = asyncio.create_task(self._drain_broadcasts())
+        
+        if coalesce:
+            slot = self._pending_progress.get(job_id)
+            if slot is not None:
+                slot[0] = message
+                return
+            slot = self._pending_progress[job_id] = [message]
+        else:
+            # Later progress must queue behind this event, not jump ahead of it
+            self._pending_progress.pop(job_id, None)
+            slot = [message]
+        self._broadcast_queue.put_nowait((job_id, slot))
+    
+    async def _drain_broadcasts(self):
+        """Persist and broadcast queued updates one at a time"""
+        while True:
+            job_id, slot = await self._broadcast_queue.get()
+            if self._pending_progress.get(job_id) is slot:
+                del self._pending_progress[job_id]
+            message = slot[0]
+            
+            try:
+                if self.redis is not None:
+                    # One MULTI so readers never see COMPLETED before the result exists
+                    async with self.redis.pipeline(transaction=True) as pipe:
+                        if message["type"] != "progress" and job_id in self.results:
+                            pipe.set(RESULT_KEY.format(job_id), self.results[job_id].model_dump_json(), ex=self._ttl())
+                        if job_id in self.jobs:
+                            pipe.set(JOB_KEY.format(job_id), self.jobs[job_id].model_dump_json(), ex=self._ttl())
+                        await pipe.execute()
+                await self._publish(job_id, message)
+            except Exception as e:
+                logger.warning("Failed to broadcast update for %s: %s", job_id[:8], e)
+    
+    async def create_job(self) -> str:
         """Create a new job and return its ID"""
         job_id = str(uuid.uuid4())
         
@@ -83,15 +233,22 @@ class JobManager:
             current_step="queued",
             message="Job created, waiting to start..."
         )
+        await self._save(JOB_KEY.format(job_id), self.jobs[job_id])
         
         return job_id
     
-    def get_job_progress(self, job_id: str) -> Optional[JobProgress]:
+    async def get_job_progress(self, job_id: str) -> Optional[JobProgress]:
         """Get current job progress"""
+        if self.redis is not None:
+            data = await self.redis.get(JOB_KEY.format(job_id))
+            return JobProgress.model_validate_json(data) if data else None
         return self.jobs.get(job_id)
     
-    def get_job_result(self, job_id: str) -> Optional[VideoResult]:
+    async def get_job_result(self, job_id: str) -> Optional[VideoResult]:
         """Get final job result (if completed)"""
+        if self.redis is not None:
+            data = await self.redis.get(RESULT_KEY.format(job_id))
+            return VideoResult.model_validate_json(data) if data else None
         return self.results.get(job_id)
     
     def update_progress(
@@ -103,28 +260,26 @@ class JobManager:
         message: str
     ):
         """Update job progress and broadcast to WebSocket clients"""
-        print(f"[DEBUG] update_progress called for {job_id[:8]}, job exists: {job_id in self.jobs}", flush=True)
         if job_id in self.jobs:
             self.jobs[job_id].status = status
             self.jobs[job_id].progress_percent = progress_percent
             self.jobs[job_id].current_step = current_step
             self.jobs[job_id].message = message
             
-            print(f"[{job_id[:8]}] {progress_percent}% - {message}", flush=True)
+            logger.debug("[%s] %d%% - %s", job_id[:8], progress_percent, message)
             
             # Broadcast to WebSocket clients
-            asyncio.create_task(
-                self.connection_manager.broadcast_to_job(
-                    job_id,
-                    {
-                        "type": "progress",
-                        "job_id": job_id,
-                        "status": status.value,
-                        "progress_percent": progress_percent,
-                        "current_step": current_step,
-                        "message": message
-                    }
-                )
+            self._enqueue(
+                job_id,
+                {
+                    "type": "progress",
+                    "job_id": job_id,
+                    "status": status.value,
+                    "progress_percent": progress_percent,
+                    "current_step": current_step,
+                    "message": message
+                },
+                coalesce=True
             )
     
     def set_result(
@@ -157,20 +312,18 @@ class JobManager:
                 self.jobs[job_id].error = error
         
         # Broadcast completion to WebSocket clients
-        asyncio.create_task(
-            self.connection_manager.broadcast_to_job(
-                job_id,
-                {
-                    "type": "complete" if not error else "error",
-                    "job_id": job_id,
-                    "status": status.value,
-                    "video_url": video_url,
-                    "thumbnail_url": thumbnail_url,
-                    "duration": duration,
-                    "script": script,
-                    "error": error
-                }
-            )
+        self._enqueue(
+            job_id,
+            {
+                "type": "complete" if not error else "error",
+                "job_id": job_id,
+                "status": status.value,
+                "video_url": video_url,
+                "thumbnail_url": thumbnail_url,
+                "duration": duration,
+                "script": script,
+                "error": error
+            }
         )
     
     async def run_job(
@@ -188,7 +341,7 @@ class JobManager:
             job_func: The actual processing function (can be sync or async)
             *args, **kwargs: Arguments for job_func
         """
-        print(f"[JobManager] run_job started for {job_id[:8]}", flush=True)
+        logger.info("Job %s started", job_id[:8])
         
         try:
             self.update_progress(
@@ -203,17 +356,21 @@ class JobManager:
             if asyncio.iscoroutinefunction(job_func):
                 result = await job_func(job_id, *args, **kwargs)
             else:
-                # Run sync function in executor
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(None, job_func, job_id, *args, **kwargs)
+                # Run sync function in the job executor
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    self.job_executor,
+                    functools.partial(job_func, job_id, *args, **kwargs)
+                )
             
             # Job succeeded
             self.set_result(job_id, **result)
+            logger.info("Job %s completed", job_id[:8])
             
         except Exception as e:
             # Job failed
             error_msg = f"Job failed: {str(e)}"
-            print(f"❌ {error_msg}")
+            logger.error("Job %s failed: %s", job_id[:8], e)
             
             self.set_result(job_id, error=error_msg)
             self.update_progress(
@@ -232,20 +389,26 @@ class JobManager:
         **kwargs
     ):
         """Start a job in the background"""
-        print(f"[JobManager] Starting async job {job_id[:8]}...", flush=True)
         try:
-            task = asyncio.create_task(self.run_job(job_id, job_func, *args, **kwargs))
+            task = asyncio.create_task(
+                self.run_job(job_id, job_func, *args, **kwargs),
+                name=f"job-{job_id[:8]}"
+            )
             self.tasks[job_id] = task
-            print(f"[JobManager] Task created for job {job_id[:8]}", flush=True)
+            task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+            logger.debug("Task created for job %s", job_id[:8])
         except Exception as e:
-            print(f"[JobManager] ERROR creating task: {e}", flush=True)
+            logger.error("Error creating task for job %s: %s", job_id[:8], e)
             raise
     
-    def cleanup_old_jobs(self, max_age_hours: int = 24):
-        """Remove old jobs from memory"""
-        # In production, store in Redis or database
-        # For now, just keep everything in memory
-        pass
+    def cleanup_old_jobs(self, max_age_hours: Optional[int] = None):
+        """Remove jobs created more than max_age_hours ago from memory"""
+        # Redis entries expire via their TTL (MAX_VIDEO_AGE_HOURS)
+        max_age = (max_age_hours or settings.MAX_VIDEO_AGE_HOURS) * 3600
+        for cache in (self.jobs, self.results):
+            # Entries expire at insert time + ttl, so shift the clock to drop
+            # anything inserted before now - max_age
+            cache.expire(cache.timer() + cache.ttl - max_age)
 
 
 # Global job manager instance
@@ -1,6 +1,6 @@
 """List available Google Generative AI models"""
-import google.generativeai as genai
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load .env file
@@ -11,14 +11,21 @@ if not api_key:
     print("ERROR: GOOGLE_API_KEY not found in backend/.env")
     exit(1)
 
+# Imported after the key check so a misconfigured run exits without loading the SDK
+import google.generativeai as genai
+
 genai.configure(api_key=api_key)
 
 print("=" * 60)
 print("Available Google Generative AI Models:")
 print("=" * 60)
 
+# list_models() pages lazily; write each match as it arrives (one write per model)
 for m in genai.list_models():
     if 'generateContent' in m.supported_generation_methods:
-        print(f"\n✓ {m.name}")
-        print(f"  Display Name: {m.display_name}")
-        print(f"  Methods: {', '.join(m.supported_generation_methods)}")
+        sys.stdout.write(
+            f"\n✓ {m.name}\n"
+            f"  Display Name: {m.display_name}\n"
+            f"  Methods: {', '.join(m.supported_generation_methods)}\n"
+        )
+        sys.stdout.flush()